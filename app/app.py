@@ -3,13 +3,22 @@ import pandas as pd
 import plotly.express as px
 import os
 import time
+import multiprocessing
 from pathlib import Path
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Start workers from a forkserver preloaded with the worker modules where
+# the platform supports it; spawn platforms warm up via the pool initializer.
+if "forkserver" in multiprocessing.get_all_start_methods():
+    multiprocessing.set_start_method("forkserver", force=True)
+    multiprocessing.set_forkserver_preload(["utils.preprocessing", "utils.comparison"])
+
 from utils.preprocessing import run_parallel_preprocessing
 from helper import (
     clear_directory,
     initialize_directories,
+    load_results,
     process_uploaded_files,
     display_summary,
     display_max_plagiarism_per_file,
@@ -22,7 +31,7 @@ st.set_page_config(page_title="Parallel Code Plagiarism Checker", layout="wide")
 st.title("🧪 Parallel Code Plagiarism Checker")
 
 
-RESULTS_CSV = "data/results/similarity_results.csv"
+RESULTS_FILE = "data/results/similarity_results.parquet"
 UPLOAD_DIR = "data/uploads"
 PROGRESS_FILE = "data/progress.json"
 PREPROCESSED_DIR = "data/preprocessed"
@@ -45,14 +54,14 @@ def main():
         clear_directory(UPLOAD_DIR)
         clear_directory(PREPROCESSED_DIR)
         
-        clear_directory(os.path.dirname(RESULTS_CSV))
+        clear_directory(os.path.dirname(RESULTS_FILE))
         if os.path.exists(HIGHLIGHTED_RESULTS_FILE):
             os.remove(HIGHLIGHTED_RESULTS_FILE)
         st.session_state.clear()
         st.sidebar.success("✅ Cleared all uploaded files and results.")
     
-    if "results_df" not in st.session_state and process_uploaded_files(uploaded_files) and os.path.exists(RESULTS_CSV):
-        st.session_state.results_df = pd.read_csv(RESULTS_CSV)
+    if "results_df" not in st.session_state and process_uploaded_files(uploaded_files) and os.path.exists(RESULTS_FILE):
+        st.session_state.results_df = load_results(RESULTS_FILE)
     
     if "results_df" in st.session_state:
         df = st.session_state.results_df
@@ -1,64 +1,152 @@
 import os
 import json
+import hashlib
 import shutil
 import time
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import psutil
 import multiprocessing
 from pathlib import Path
 import streamlit as st
 import plotly.express as px
 from utils.preprocessing import run_parallel_preprocessing
-from utils.comparison import run_parallel_comparison, save_results_to_csv, compare_pair
+from utils.comparison import run_batch_comparison, run_lsh_comparison, save_results_to_parquet, compare_pair, load_code
+from utils.fast_compare import build_highlight
 
 
 
-RESULTS_CSV = "data/results/similarity_results.csv"
+RESULTS_FILE = "data/results/similarity_results.parquet"
 UPLOAD_DIR = "data/uploads"
 PROGRESS_FILE = "data/progress.json"
 PREPROCESSED_DIR = "data/preprocessed"
 HIGHLIGHTED_RESULTS_FILE = "data/highlighted_results.json"
 VALID_EXTENSIONS = {'.py', '.cpp', '.h', '.cc', '.cxx', '.java'}
 MAX_FILE_SIZE_MB = 10
+LSH_FILE_THRESHOLD = 50
 
 
 def clear_directory(directory):
     try:
-        for filename in os.listdir(directory):
-            file_path = os.path.join(directory, filename)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
     except Exception as e:
         st.error(f"Error clearing directory {directory}: {e}")
 
 
 def initialize_directories():
-    for directory in [UPLOAD_DIR, PREPROCESSED_DIR, os.path.dirname(RESULTS_CSV)]:
+    for directory in [UPLOAD_DIR, PREPROCESSED_DIR, os.path.dirname(RESULTS_FILE)]:
         os.makedirs(directory, exist_ok=True)
 
 
 
+last_progress_write = 0.0
+
+
 def update_progress(completed, total, stage=""):
+    global last_progress_write
+    # Terminal updates always land; intermediate ticks are throttled to 10 Hz.
+    final = completed >= total or stage == "error"
+    if not final and time.monotonic() - last_progress_write < 0.1:
+        return
     try:
-        with open(PROGRESS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({
-                "stage": stage,
-                "completed_pairs": completed,
-                "total_pairs": total
-            }, f, ensure_ascii=False)
+        payload = json.dumps({
+            "stage": stage,
+            "completed_pairs": completed,
+            "total_pairs": total
+        }, ensure_ascii=False).encode('utf-8')
+        tmp_path = PROGRESS_FILE + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        try:
+            os.write(fd, payload)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, PROGRESS_FILE)
+        last_progress_write = time.monotonic()
     except (IOError, OSError) as e:
         st.warning(f"Error writing progress: {e}")
         
 
+# Prime the counters so the first non-blocking reading is meaningful.
+try:
+    psutil.cpu_percent(interval=None)
+except Exception:
+    pass
+
+
 def monitor_cpu_usage():
     try:
-        return psutil.cpu_percent(interval=0.5), psutil.cpu_count(logical=True)
+        return psutil.cpu_percent(interval=None), psutil.cpu_count(logical=True)
     except Exception:
         return 0.0, multiprocessing.cpu_count()
 
 
+@st.cache_data
+def unique_files(df):
+    """All file names appearing in either column, deduplicated at the Arrow level."""
+    combined = pa.chunked_array([
+        pa.Array.from_pandas(df["File 1"]),
+        pa.Array.from_pandas(df["File 2"])
+    ])
+    return pc.unique(combined).to_pylist()
+
+
+@st.cache_data
+def to_arrow(df):
+    """Pre-convert a frame to Arrow so st.dataframe skips the pandas conversion."""
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+@st.cache_data
+def df_to_csv_bytes(df):
+    """Serialize a DataFrame for download once per distinct content."""
+    return df.to_csv(index=False).encode('utf-8')
+
+
+@st.cache_data(show_spinner=False)
+def read_results_file(path, mtime):
+    # Sorted once here so range filters reduce to two binary searches.
+    df = pd.read_parquet(path)
+    return df.sort_values("Similarity %").reset_index(drop=True)
+
+
+def load_results(path):
+    """Load the persisted results, reusing the cache until the file changes."""
+    return read_results_file(path, os.path.getmtime(path))
+
+
+def preload_worker():
+    """Warm heavy imports once per worker instead of once per task batch."""
+    from utils import comparison, preprocessing  # noqa: F401
+
+
+def stream_to_disk(file, file_path, chunk_size=1024 * 1024):
+    """Stream an uploaded file to disk in chunks, hashing as it goes."""
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'wb') as f:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            f.write(chunk)
+    return hasher.hexdigest()
+
+
+@st.cache_data
+def run_cached_comparison(preprocessed_files, content_hashes):
+    """Re-run comparison only when the set of uploaded contents changes."""
+    if len(preprocessed_files) > LSH_FILE_THRESHOLD:
+        return run_lsh_comparison(preprocessed_files)
+    return run_batch_comparison(preprocessed_files)
+
+
 def process_uploaded_files(uploaded_files):
     start_time = time.perf_counter()
     if not uploaded_files:
@@ -80,14 +168,16 @@ def process_uploaded_files(uploaded_files):
     status_text.info("⏳ Uploading files...")
     
     uploaded_file_paths = []
+    file_hashes = {}
+    update_step = max(1, total_files // 50)
     for i, file in enumerate(uploaded_files):
         safe_name = Path(file.name).name.replace("..", "").replace("/", "").replace("\\", "")
         file_path = os.path.join(UPLOAD_DIR, safe_name)
-        with open(file_path, 'wb') as f:
-            f.write(file.read())
+        file_hashes[file_path] = stream_to_disk(file, file_path)
         uploaded_file_paths.append(file_path)
-        progress_bar.progress((i + 1) / total_steps)
-        status_text.info(f"📤 Uploaded {i + 1}/{total_files} files...")
+        if (i % update_step) == 0 or i == total_files - 1:
+            progress_bar.progress((i + 1) / total_steps)
+            status_text.info(f"📤 Uploaded {i + 1}/{total_files} files...")
     
     st.sidebar.success(f"✅ Uploaded {total_files} files successfully.")
     
@@ -98,12 +188,12 @@ def process_uploaded_files(uploaded_files):
     start_time = time.perf_counter()
     update_progress(0, total_files, "preprocessing")
     try:
-        preprocessed_files = run_parallel_preprocessing()
+        # One pool serves every pool-based stage; spawn platforms only pay
+        # worker startup once per batch.
+        with multiprocessing.Pool(processes=os.cpu_count(), initializer=preload_worker) as pool:
+            preprocessed_files = run_parallel_preprocessing(file_hashes, pool, uploaded_file_paths)
         preprocessed_files = [out_path for _, out_path in preprocessed_files if out_path]
-        if len(preprocessed_files) < len(uploaded_file_paths):
-            update_progress(len(preprocessed_files), len(uploaded_file_paths), "preprocessing")
-            progress_bar.progress((total_files + len(preprocessed_files) / len(uploaded_file_paths)) / total_steps)
-            status_text.info(f"🔍 Preprocessing: {len(preprocessed_files)}/{len(uploaded_file_paths)} files...")
+        update_progress(len(preprocessed_files), len(uploaded_file_paths), "preprocessing")
         cpu_usage, _ = monitor_cpu_usage()
         stage_times["Preprocessing"] = time.perf_counter() - start_time
         stage_cpu["Preprocessing"] = cpu_usage
@@ -121,11 +211,8 @@ def process_uploaded_files(uploaded_files):
     start_time = time.perf_counter()
     update_progress(0, total_pairs, "comparison")
     try:
-        results = run_parallel_comparison(preprocessed_files)
-        if len(results) < total_pairs:
-            update_progress(len(results), total_pairs, "comparison")
-            progress_bar.progress((total_files + len(results) / total_pairs) / total_steps)
-            status_text.info(f"🔍 Comparison: {len(results)}/{total_pairs} pairs...")
+        results = run_cached_comparison(preprocessed_files, tuple(sorted(file_hashes.values())))
+        update_progress(total_pairs, total_pairs, "comparison")
         cpu_usage, _ = monitor_cpu_usage()
         stage_times["Comparison"] = time.perf_counter() - start_time
         stage_cpu["Comparison"] = cpu_usage
@@ -137,7 +224,7 @@ def process_uploaded_files(uploaded_files):
     start_time = time.perf_counter()
     update_progress(0, 1, "saving_csv")
     try:
-        save_results_to_csv(results, RESULTS_CSV)
+        save_results_to_parquet(results, RESULTS_FILE)
         cpu_usage, cpu_cores = monitor_cpu_usage()
         stage_times["Saving CSV"] = time.perf_counter() - start_time
         stage_cpu["Saving CSV"] = cpu_usage
@@ -150,8 +237,8 @@ def process_uploaded_files(uploaded_files):
         return False
     
 
-    st.session_state.results_df = pd.read_csv(RESULTS_CSV)
-    
+    st.session_state.results_df = load_results(RESULTS_FILE)
+
     st.subheader("📊 Processing Metrics")
     metrics_df = pd.DataFrame({
         "Stage": list(stage_times.keys()),
@@ -202,40 +289,37 @@ def highlight_matching_text(file1_name, file2_name):
     file1_path = Path(PREPROCESSED_DIR) / file1_name
     file2_path = Path(PREPROCESSED_DIR) / file2_name
     try:
-        _, _, _, content1, content2, matching_blocks = compare_pair(file1_path, file2_path)
+        _, _, _, blocks = compare_pair(file1_path, file2_path)
+        content1 = load_code(file1_path)
+        content2 = load_code(file2_path)
     except Exception as e:
         return f"Error comparing files: {e}", f"Error comparing files: {e}"
-    highlighted1 = []
-    highlighted2 = []
-    pos1 = pos2 = 0
-    for match in matching_blocks:
-        a, b, size = match.a, match.b, match.size
-        if pos1 < a:
-            highlighted1.append(content1[pos1:a])
-        if pos2 < b:
-            highlighted2.append(content2[pos2:b])
-        if size > 0:
-            matching_text1 = content1[a:a + size]
-            matching_text2 = content2[b:b + size]
-            highlighted1.append(f'<span style="background-color: #FFFF99;">{matching_text1}</span>')
-            highlighted2.append(f'<span style="background-color: #FFFF99;">{matching_text2}</span>')
-        
-        pos1 = a + size
-        pos2 = b + size
-    if pos1 < len(content1):
-        highlighted1.append(content1[pos1:])
-    if pos2 < len(content2):
-        highlighted2.append(content2[pos2:])
-    
-    return "".join(highlighted1), "".join(highlighted2)
+    open_tag = np.frombuffer(bytearray(b'<span style="background-color: #FFFF99;">'), dtype=np.uint8)
+    close_tag = np.frombuffer(bytearray(b'</span>'), dtype=np.uint8)
+    bytes1 = np.frombuffer(bytearray(content1.encode('utf-8')), dtype=np.uint8)
+    bytes2 = np.frombuffer(bytearray(content2.encode('utf-8')), dtype=np.uint8)
+    highlighted1 = build_highlight(bytes1, np.ascontiguousarray(blocks[:, 0]),
+                                   np.ascontiguousarray(blocks[:, 2]), open_tag, close_tag)
+    highlighted2 = build_highlight(bytes2, np.ascontiguousarray(blocks[:, 1]),
+                                   np.ascontiguousarray(blocks[:, 2]), open_tag, close_tag)
+    return (highlighted1.tobytes().decode('utf-8', errors='ignore'),
+            highlighted2.tobytes().decode('utf-8', errors='ignore'))
 
 
 @st.cache_data
 def prepare_pie_chart_data(_df, bins, labels):
     """Prepare data for pie chart."""
-    range_categories = pd.cut(_df["Similarity %"], bins=bins, labels=labels, include_lowest=True)
-    range_counts = range_categories.value_counts().sort_index()
-    return range_counts, [f"{label} ({count})" for label, count in zip(range_counts.index, range_counts)]
+    sims = _df["Similarity %"].to_numpy()
+    buckets = np.digitize(sims, bins[1:], right=True)
+    counts = np.bincount(buckets, minlength=len(labels))
+    range_counts = pd.Series(counts, index=labels)
+    return range_counts, [f"{label} ({count})" for label, count in zip(labels, counts)]
+
+
+@st.cache_data
+def file_involvement_counts(filtered_df):
+    """Count how often each file appears in the filtered pairs."""
+    return pd.concat([filtered_df["File 1"], filtered_df["File 2"]]).value_counts()
 
 
 
@@ -243,7 +327,7 @@ def display_summary(df):
     """Display summary statistics."""
     start_time = time.perf_counter()
     st.subheader("📈 Summary Statistics")
-    total_files = len(set(df["File 1"]).union(df["File 2"]))
+    total_files = len(unique_files(df))
     total_pairs = len(df)
     max_similarity = df["Similarity %"].max()
     high_similarity_pairs = len(df[df["Similarity %"] >= 80])
@@ -261,24 +345,25 @@ def display_max_plagiarism_per_file(df):
     with st.expander("Display each file's highest plagiarism match", expanded=False):
         start_time = time.perf_counter()
         st.subheader("🔍 Each File's Highest Plagiarism Match")
-        df['Pair'] = df.apply(lambda row: tuple(sorted([row['File 1'], row['File 2']])), axis=1)
-        df['File'] = df['File 1']
-        df['Matched With'] = df['File 2']
-        
-        file_similarities = []
-        all_files = set(df["File 1"]).union(df["File 2"])
-        for file in all_files:
-            subset = df[(df["File 1"] == file) | (df["File 2"] == file)].copy()
-            if not subset.empty:
-                subset['Matched With'] = subset.apply(
-                    lambda row: row['File 2'] if row['File 1'] == file else row['File 1'], axis=1)
-                max_row = subset.loc[subset['Similarity %'].idxmax()]
-                file_similarities.append({
-                    'File': file,
-                    'Matched With': max_row['Matched With'],
-                    'Similarity %': max_row['Similarity %']
-                })
-        match_df = pd.DataFrame(file_similarities)
+        sim = df["Similarity %"].to_numpy()
+        n_pairs = len(df)
+        files = pd.Categorical(np.concatenate([df["File 1"].to_numpy(), df["File 2"].to_numpy()]))
+        owner = files.codes
+        partner = np.concatenate([owner[n_pairs:], owner[:n_pairs]])
+        sims = np.tile(sim, 2)
+
+        n_files = len(files.categories)
+        best = np.full(n_files, -1.0)
+        np.maximum.at(best, owner, sims)
+        is_best = sims == best[owner]
+        best_partner = np.full(n_files, -1, dtype=np.int32)
+        best_partner[owner[is_best]] = partner[is_best]
+
+        match_df = pd.DataFrame({
+            'File': files.categories,
+            'Matched With': files.categories[best_partner],
+            'Similarity %': best
+        })
         match_df = match_df.sort_values(by="Similarity %", ascending=False).reset_index(drop=True)
         
         st.dataframe(match_df, use_container_width=True)
@@ -286,7 +371,7 @@ def display_max_plagiarism_per_file(df):
         
         st.download_button(
             label="📥 Download Highest Match Table",
-            data=match_df.to_csv(index=False).encode('utf-8'),
+            data=df_to_csv_bytes(match_df),
             file_name="highest_match_per_file.csv",
             mime='text/csv'
         )    
@@ -332,24 +417,29 @@ def display_filtered_results(df):
 
     min_similarity, max_similarity = similarity_range
 
-    filtered_df = df[(df["Similarity %"] >= min_similarity) & (df["Similarity %"] <= max_similarity)]
+    sims_np = df["Similarity %"].to_numpy()
+    lo_i = np.searchsorted(sims_np, min_similarity, side='left')
+    hi_i = np.searchsorted(sims_np, max_similarity, side='right')
+    filtered_df = df.iloc[lo_i:hi_i]
         
     with st.expander("📋 File Pair Similarity Results", expanded=False):
-        st.write("Click a file pair to view their contents with matching text highlighted.")
-        for index, row in filtered_df.iterrows():
-            file1, file2, similarity = row["File 1"], row["File 2"], row["Similarity %"]
-            col1, col2, col3 = st.columns([2, 2, 1])
-            with col1:
-                if st.button(f"{file1} vs {file2}", key=f"pair_{file1}_{file2}_{index}"):
-                    st.session_state.selected_pair = (file1, file2)
-            with col2:
-                st.write(f"{similarity:.2f}%")
-            with col3:
-                st.write("")
-        
+        st.write("Select a file pair to view their contents with matching text highlighted.")
+        event = st.dataframe(
+            to_arrow(filtered_df),
+            use_container_width=True,
+            hide_index=True,
+            on_select="rerun",
+            selection_mode="single-row",
+            key="pair_table"
+        )
+        if event.selection.rows:
+            selected = filtered_df.iloc[event.selection.rows[0]]
+            st.session_state.selected_pair = (selected["File 1"], selected["File 2"])
+
+
     st.download_button(
         label="📥 Download Filtered Results CSV",
-        data=filtered_df.to_csv(index=False).encode('utf-8'),
+        data=df_to_csv_bytes(filtered_df),
         file_name="filtered_similarity_results.csv",
         mime='text/csv'
     )
@@ -380,7 +470,7 @@ def display_filtered_results(df):
     
     with st.expander("📊 Files Involved in High Similarity Matches", expanded=False):
         st.subheader("📊 Files Involved in High Similarity Matches")
-        file_counts = pd.concat([filtered_df["File 1"], filtered_df["File 2"]]).value_counts()
+        file_counts = file_involvement_counts(filtered_df)
         fig = px.bar(
             x=file_counts.values,
             y=file_counts.index,
@@ -398,12 +488,13 @@ def display_top_n_pairs(df):
     with st.expander("🔝 Top N Most Similar Pairs", expanded=False):
         st.subheader("🔝 Top N Most Similar Pairs")
         top_n = st.slider("Select Top N", 5, 50, 10)
-        top_df = df.sort_values("Similarity %", ascending=False).head(top_n)
-        st.dataframe(top_df.reset_index(drop=True))
+        # df is kept sorted ascending by the loader, so top N is a tail slice.
+        top_df = df.tail(top_n).iloc[::-1].reset_index(drop=True)
+        st.dataframe(to_arrow(top_df))
         
         st.download_button(
             label="📥 Download Top Similar Pairs CSV",
-            data=top_df.to_csv(index=False).encode('utf-8'),
+            data=df_to_csv_bytes(top_df),
             file_name="top_similar_pairs.csv",
             mime='text/csv'
         )
@@ -415,7 +506,7 @@ def display_file_similarities(df):
     """Display similarities for a specific file."""
     start_time = time.perf_counter()
     st.subheader("🔍 Check Similarities for a Specific File")
-    file_list = sorted(set(df["File 1"]).union(df["File 2"]))
+    file_list = sorted(unique_files(df))
     selected_file = st.selectbox("Choose a file", file_list, key="file_selectbox")
     subset = df[(df["File 1"] == selected_file) | (df["File 2"] == selected_file)]
     st.dataframe(subset.sort_values("Similarity %", ascending=False))
@@ -1,31 +1,158 @@
+import csv
 import os
-import difflib
 import itertools
+from functools import lru_cache
 from multiprocessing import Pool
-import pandas as pd
+import numpy as np
+from scipy import sparse
+from rapidfuzz.distance import Indel
+from utils.fast_compare import similarity, load_signature, jaccard
+from utils.preprocessing import pack_to_memmap
+from utils.lsh import candidate_pairs, candidate_pairs_matrix
+
+MATRIX_CANDIDATE_LIMIT = 1024
+
+VOCAB_BITS = 20
+LENGTH_RATIO_THRESHOLD = 0.2
+
+worker_signatures = None
+worker_mmap_path = None
+
+def open_memmap(mmap_path):
+    global worker_signatures, worker_mmap_path
+    worker_signatures = np.memmap(mmap_path, dtype=np.uint64, mode='r')
+    worker_mmap_path = mmap_path
+
+def compare_packed_pair(mmap_path, name1, name2, start1, end1, start2, end2):
+    # Opened lazily so the pool can be shared with other stages.
+    if worker_mmap_path != mmap_path:
+        open_memmap(mmap_path)
+    # Copy out of the read-only memmap: the jaccard signature only
+    # accepts writable arrays.
+    sig1 = np.array(worker_signatures[start1:end1], copy=True)
+    sig2 = np.array(worker_signatures[start2:end2], copy=True)
+    score = round(float(jaccard(sig1, sig2)) * 100, 2)
+    return (name1, name2, score)
+
+@lru_cache(maxsize=256)
+def read_code(path: str, mtime: float) -> str:
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read()
+
+def load_code(path) -> str:
+    path = str(path)
+    return read_code(path, os.path.getmtime(path))
 
 def compare_pair(file1_path: str, file2_path: str) -> tuple:
-    with open(file1_path, 'r', encoding='utf-8', errors='ignore') as f1:
-        code1 = f1.read()
-    with open(file2_path, 'r', encoding='utf-8', errors='ignore') as f2:
-        code2 = f2.read()
+    code1 = load_code(file1_path)
+    code2 = load_code(file2_path)
+
+    name1, name2 = os.path.basename(file1_path), os.path.basename(file2_path)
+    bytes1, bytes2 = code1.encode('utf-8'), code2.encode('utf-8')
+    if bytes1 == bytes2:
+        blocks = np.array([(0, 0, len(bytes1)), (len(bytes1), len(bytes2), 0)], dtype=np.int32)
+        return (name1, name2, 100.0, blocks)
 
-    matcher = difflib.SequenceMatcher(None, code1, code2)
-    score = round(matcher.ratio() * 100, 2)
-    
-    matching_blocks = matcher.get_matching_blocks()
-    return (os.path.basename(file1_path), os.path.basename(file2_path), score, code1, code2, matching_blocks)
+    score = similarity(file1_path, file2_path)
+
+    # Wildly mismatched lengths bound the match ratio so low that the
+    # block alignment is not worth computing.
+    shorter, longer = sorted((len(bytes1), len(bytes2)))
+    if longer and shorter / longer < LENGTH_RATIO_THRESHOLD:
+        blocks = np.array([(len(bytes1), len(bytes2), 0)], dtype=np.int32)
+        return (name1, name2, score, blocks)
+
+    # Align whitespace-delimited tokens, not characters: orders of
+    # magnitude fewer elements for the same highlight spans.
+    tokens1 = bytes1.split(b' ')
+    tokens2 = bytes2.split(b' ')
+    offsets1 = np.concatenate(([0], np.cumsum([len(t) + 1 for t in tokens1])))
+    offsets2 = np.concatenate(([0], np.cumsum([len(t) + 1 for t in tokens2])))
+    blocks = []
+    for m in Indel.editops(tokens1, tokens2).as_matching_blocks():
+        if m.size:
+            blocks.append((offsets1[m.a], offsets2[m.b],
+                           offsets1[m.a + m.size] - offsets1[m.a] - 1))
+    blocks.append((len(bytes1), len(bytes2), 0))
+    blocks = np.array(blocks, dtype=np.int32).reshape(-1, 3)
+    return (name1, name2, score, blocks)
+
+def compare_packed_star(args):
+    return compare_packed_pair(*args)
 
 def generate_file_pairs(file_paths: list) -> list:
     return list(itertools.combinations(file_paths, 2))
 
-def run_parallel_comparison(file_paths: list) -> list:
-    pairs = generate_file_pairs(file_paths)
-    with Pool() as pool:
-        results = pool.starmap(compare_pair, pairs)
-    return results 
+def run_parallel_comparison(file_paths: list, pool=None) -> list:
+    if len(file_paths) < 2:
+        return []
+    mmap_path, offsets = pack_to_memmap(file_paths)
+    names = [os.path.basename(p) for p in file_paths]
+    pairs = candidate_pairs([load_signature(p) for p in file_paths])
+    if not pairs:
+        return []
+    args = ((mmap_path, names[i], names[j],
+             offsets[i], offsets[i + 1],
+             offsets[j], offsets[j + 1]) for i, j in pairs)
+    chunk = max(1, len(pairs) // (4 * os.cpu_count()))
+    if pool is not None:
+        return list(pool.imap_unordered(compare_packed_star, args, chunksize=chunk))
+    with Pool(processes=os.cpu_count()) as own_pool:
+        return list(own_pool.imap_unordered(compare_packed_star, args, chunksize=chunk))
+
+def run_batch_comparison(file_paths: list) -> list:
+    if len(file_paths) < 2:
+        return []
+    vocab_size = 1 << VOCAB_BITS
+    rows, cols = [], []
+    for i, path in enumerate(file_paths):
+        shingles = np.unique(load_signature(path) & np.uint64(vocab_size - 1)).astype(np.int64)
+        rows.append(np.full(shingles.size, i, dtype=np.int64))
+        cols.append(shingles)
+    matrix = sparse.csr_matrix(
+        (np.ones(sum(c.size for c in cols), dtype=np.int64),
+         (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(file_paths), vocab_size)
+    )
+    intersections = (matrix @ matrix.T).toarray()
+    sizes = matrix.sum(axis=1).A1
+    unions = sizes[:, None] + sizes[None, :] - intersections
+    jaccard = np.where(unions > 0, intersections / np.maximum(unions, 1), 0.0)
+
+    names = [os.path.basename(p) for p in file_paths]
+    results = []
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            results.append((names[i], names[j], round(float(jaccard[i, j]) * 100, 2)))
+    return results
+
+def run_lsh_comparison(file_paths: list) -> list:
+    """Score only pairs whose MinHash signatures collide in at least one LSH band."""
+    if len(file_paths) < 2:
+        return []
+    signatures = [load_signature(p) for p in file_paths]
+    names = [os.path.basename(p) for p in file_paths]
+    # Below the limit the dense N x N x perm estimate fits comfortably and
+    # beats Python-level bucket enumeration; banding takes over beyond it.
+    if len(file_paths) <= MATRIX_CANDIDATE_LIMIT:
+        pairs = candidate_pairs_matrix(signatures)
+    else:
+        pairs = candidate_pairs(signatures)
+    results = []
+    for i, j in pairs:
+        score = round(float(jaccard(signatures[i], signatures[j])) * 100, 2)
+        results.append((names[i], names[j], score))
+    return results
 
 def save_results_to_csv(results: list, output_path: str):
-    df = pd.DataFrame(results, columns=['File 1', 'File 2', 'Similarity %', 'Code 1', 'Code 2', 'Matching Blocks'])
-    df[['File 1', 'File 2', 'Similarity %']].to_csv(output_path, index=False)
+    with open(output_path, 'w', newline='', buffering=1 << 20) as f:
+        writer = csv.writer(f)
+        writer.writerow(['File 1', 'File 2', 'Similarity %'])
+        writer.writerows(r[:3] for r in results)
+
+def save_results_to_parquet(results: list, output_path: str):
+    # Imported here so spawn-started workers never pay for pandas.
+    import pandas as pd
+    df = pd.DataFrame([r[:3] for r in results], columns=['File 1', 'File 2', 'Similarity %'])
+    df.to_parquet(output_path, engine='pyarrow', compression='snappy', index=False)
     return df
\ No newline at end of file
@@ -0,0 +1,136 @@
+import os
+import numpy as np
+from numba import njit, prange
+
+SHINGLE_K = 5
+
+FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+FNV_PRIME = np.uint64(0x100000001b3)
+
+
+@njit('u8[::1](i8[::1], i8)', cache=True, parallel=True)
+def shingle_hash(tokens, k):
+    n = tokens.shape[0] - k + 1
+    if n < 0:
+        n = 0
+    out = np.empty(n, dtype=np.uint64)
+    for i in prange(n):
+        h = FNV_OFFSET
+        for j in range(i, i + k):
+            h = (h ^ np.uint64(tokens[j])) * FNV_PRIME
+        out[i] = h
+    return out
+
+
+@njit('i8[::1](u1[::1])', cache=True)
+def hash_tokens(buf):
+    out = np.empty(buf.shape[0] // 2 + 1, dtype=np.int64)
+    n = 0
+    h = FNV_OFFSET
+    in_token = False
+    for i in range(buf.shape[0]):
+        c = buf[i]
+        if 65 <= c <= 90:
+            c |= 0x20
+        if c == 32 or c == 9 or c == 10 or c == 13:
+            if in_token:
+                out[n] = np.int64(h)
+                n += 1
+                in_token = False
+                h = FNV_OFFSET
+        else:
+            h = (h ^ np.uint64(c)) * FNV_PRIME
+            in_token = True
+    if in_token:
+        out[n] = np.int64(h)
+        n += 1
+    return out[:n]
+
+
+@njit('f4(u8[::1], u8[::1])', cache=True)
+def jaccard(a, b):
+    if a.shape[0] == 0 and b.shape[0] == 0:
+        return np.float32(0.0)
+    i = j = 0
+    intersection = 0
+    while i < a.shape[0] and j < b.shape[0]:
+        if a[i] == b[j]:
+            intersection += 1
+            i += 1
+            j += 1
+        elif a[i] < b[j]:
+            i += 1
+        else:
+            j += 1
+    union = a.shape[0] + b.shape[0] - intersection
+    if union == 0:
+        return np.float32(0.0)
+    return np.float32(intersection / union)
+
+
+@njit('u1[::1](u1[::1], i4[::1], i4[::1], u1[::1], u1[::1])', cache=True)
+def build_highlight(content, starts, sizes, open_tag, close_tag):
+    tag_len = open_tag.shape[0] + close_tag.shape[0]
+    out = np.empty(content.shape[0] + tag_len * starts.shape[0], dtype=np.uint8)
+    pos = 0
+    n = 0
+    for k in range(starts.shape[0]):
+        start = starts[k]
+        size = sizes[k]
+        while pos < start:
+            out[n] = content[pos]
+            n += 1
+            pos += 1
+        if size > 0:
+            for t in range(open_tag.shape[0]):
+                out[n] = open_tag[t]
+                n += 1
+            for _ in range(size):
+                out[n] = content[pos]
+                n += 1
+                pos += 1
+            for t in range(close_tag.shape[0]):
+                out[n] = close_tag[t]
+                n += 1
+    while pos < content.shape[0]:
+        out[n] = content[pos]
+        n += 1
+        pos += 1
+    return out[:n]
+
+
+def build_signature(code: str, k: int = SHINGLE_K) -> np.ndarray:
+    buf = np.frombuffer(bytearray(code.encode('utf-8')), dtype=np.uint8)
+    tokens = hash_tokens(buf)
+    if tokens.size == 0:
+        return np.empty(0, dtype=np.uint64)
+    if tokens.size < k:
+        k = tokens.size
+    return np.unique(shingle_hash(tokens, k))
+
+
+def signature_path(preprocessed_path) -> str:
+    return str(preprocessed_path) + '.npy'
+
+
+def save_signature(preprocessed_path, code: str) -> str:
+    sig_path = signature_path(preprocessed_path)
+    np.save(sig_path, build_signature(code))
+    return sig_path
+
+
+def load_signature(preprocessed_path) -> np.ndarray:
+    sig_path = signature_path(preprocessed_path)
+    if os.path.exists(sig_path):
+        return np.load(sig_path)
+    with open(preprocessed_path, 'r', encoding='utf-8', errors='ignore') as f:
+        code = f.read()
+    signature = build_signature(code)
+    np.save(sig_path, signature)
+    return signature
+
+
+def similarity(file1_path, file2_path) -> float:
+    sig1 = load_signature(file1_path)
+    sig2 = load_signature(file2_path)
+    return round(float(jaccard(sig1, sig2)) * 100, 2)
@@ -1,19 +1,25 @@
 import os
-import fitz 
-from PIL import Image
-import pytesseract
-import io
+
+def render_page(pdf, page_num, dpi=200):
+    from PIL import Image
+    page = pdf.load_page(page_num)
+    pix = page.get_pixmap(dpi=dpi)
+    # Wrap the raw samples directly; no PNG encode/decode round trip.
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
 
 def extract_handwritten_text_from_pdf(pdf_path):
+    # Deferred so importing this module stays cheap in spawned workers.
+    import fitz
+    from tesserocr import PyTessBaseAPI
     try:
-        text = ""
         pdf = fitz.open(pdf_path)
-        for page_num in range(len(pdf)):
-            page = pdf.load_page(page_num)
-            pix = page.get_pixmap(dpi=300)
-            img_bytes = pix.tobytes("png")
-            image = Image.open(io.BytesIO(img_bytes))
-            text += pytesseract.image_to_string(image, lang='eng') + "\n"
+        text = ""
+        # One TessBaseAPI instance keeps the language model loaded across
+        # pages. Pages render sequentially: fitz documents are not thread-safe.
+        with PyTessBaseAPI(lang='eng') as api:
+            for page_num in range(len(pdf)):
+                api.SetImage(render_page(pdf, page_num))
+                text += api.GetUTF8Text() + "\n"
         return text
     except Exception as e:
         print(f"Error processing handwritten PDF {pdf_path}: {e}")
@@ -31,4 +37,4 @@ def handle_handwritten_pdf(file_path, output_dir="data/preprocessed"):
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
     with open(out_path, 'w', encoding='utf-8') as f:
         f.write(content.lower().strip())
-    return (file_path, out_path)
\ No newline at end of file
+    return (file_path, out_path)
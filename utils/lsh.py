@@ -0,0 +1,59 @@
+import itertools
+import numpy as np
+from numba import njit
+
+NUM_PERM = 128
+NUM_BANDS = 32
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+
+rng = np.random.default_rng(20240229)
+PARAM_A = rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+PARAM_B = rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+
+
+@njit('u8[::1](u8[::1], u8[::1], u8[::1])', cache=True)
+def minhash(shingles, param_a, param_b):
+    out = np.full(param_a.shape[0], np.uint64(0xffffffffffffffff), dtype=np.uint64)
+    for p in range(param_a.shape[0]):
+        best = out[p]
+        for i in range(shingles.shape[0]):
+            h = shingles[i] * param_a[p] + param_b[p]
+            if h < best:
+                best = h
+        out[p] = best
+    return out
+
+
+def estimate_jaccard_matrix(minhashes, block=256):
+    """Approximate pairwise Jaccard as the fraction of equal MinHash slots."""
+    sigs = np.stack(minhashes)
+    n = sigs.shape[0]
+    estimates = np.empty((n, n), dtype=np.float32)
+    for i in range(0, n, block):
+        estimates[i:i + block] = (
+            sigs[i:i + block, None, :] == sigs[None, :, :]
+        ).mean(axis=-1, dtype=np.float32)
+    return estimates
+
+
+def candidate_pairs_matrix(signatures, threshold=0.3):
+    """Threshold the dense MinHash estimate matrix instead of banding."""
+    minhashes = [minhash(sig, PARAM_A, PARAM_B) for sig in signatures]
+    estimates = estimate_jaccard_matrix(minhashes)
+    rows, cols = np.nonzero(np.triu(estimates >= threshold, k=1))
+    return list(zip(rows.tolist(), cols.tolist()))
+
+
+def candidate_pairs(signatures):
+    """Index MinHash signatures into banded buckets and return colliding pairs."""
+    minhashes = [minhash(sig, PARAM_A, PARAM_B) for sig in signatures]
+    buckets = {}
+    for idx, mh in enumerate(minhashes):
+        for band in range(NUM_BANDS):
+            key = (band, mh[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes())
+            buckets.setdefault(key, []).append(idx)
+    pairs = set()
+    for members in buckets.values():
+        if len(members) > 1:
+            pairs.update(itertools.combinations(members, 2))
+    return sorted(pairs)
@@ -1,34 +1,72 @@
 import os
 import re
-from multiprocessing import Pool, freeze_support
+from multiprocessing import Pool
+import numpy as np
+from utils.fast_compare import build_signature
+
+# One alternation per language so each file is scanned once. The block
+# comment alternative scopes DOTALL locally via (?s:...).
+PY_STRIP = re.compile(r'#.*|^\s*import .*$|^\s*from .* import .*$', re.MULTILINE)
+CPP_STRIP = re.compile(r'//.*|(?s:/\*.*?\*/)|^\s*#include.*$|^\s*using namespace.*;', re.MULTILINE)
+JAVA_STRIP = re.compile(r'//.*|(?s:/\*.*?\*/)|^\s*import .*;|^\s*package .*;', re.MULTILINE)
 
 def remove_python_boilerplate(code):
-    code = re.sub(r'#.*', '', code)
-    code = re.sub(r'^\s*import .*', '', code, flags=re.MULTILINE)
-    code = re.sub(r'^\s*from .* import .*', '', code, flags=re.MULTILINE)
-    return normalize_code(code)
+    return normalize_code(PY_STRIP.sub('', code))
 
 def remove_cpp_boilerplate(code):
-    code = re.sub(r'//.*', '', code)
-    code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
-    code = re.sub(r'^\s*#include.*', '', code, flags=re.MULTILINE)
-    code = re.sub(r'^\s*using namespace.*;', '', code, flags=re.MULTILINE)
-    return normalize_code(code)
+    return normalize_code(CPP_STRIP.sub('', code))
 
 def remove_java_boilerplate(code):
-    code = re.sub(r'//.*', '', code)
-    code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
-    code = re.sub(r'^\s*import .*;', '', code, flags=re.MULTILINE)
-    code = re.sub(r'^\s*package .*;', '', code, flags=re.MULTILINE)
-    return normalize_code(code)
+    return normalize_code(JAVA_STRIP.sub('', code))
 
 def normalize_code(code):
-    code = code.lower()
-    code = re.sub(r'\s+', ' ', code) 
-    return code.strip()
+    # Branchless byte-level lowercase and whitespace collapse; multi-byte
+    # UTF-8 sequences are >= 0x80 and pass through untouched.
+    buf = np.frombuffer(code.encode('utf-8'), dtype=np.uint8).copy()
+    if buf.size == 0:
+        return ''
+    upper = (buf >= 65) & (buf <= 90)
+    buf[upper] |= 0x20
+    ws = (buf == 32) | (buf == 9) | (buf == 10) | (buf == 13)
+    buf[ws] = 32
+    keep = np.ones(buf.size, dtype=bool)
+    keep[1:] = ~(ws[1:] & ws[:-1])
+    return buf[keep].tobytes().decode('utf-8', errors='ignore').strip()
+
+
+VALID_EXTENSIONS = frozenset({'.py', '.cpp', '.java', '.h'})
+SIGNATURE_PACK = os.path.join('data', 'preprocessed', 'signatures.dat')
+
+
+def pack_to_memmap(preprocessed_files, mmap_path=SIGNATURE_PACK):
+    """Concatenate per-file signatures into one memmap shared by workers."""
+    signatures = [np.load(str(p) + '.npy') for p in preprocessed_files]
+    offsets = np.zeros(len(signatures) + 1, dtype=np.int64)
+    np.cumsum([s.size for s in signatures], out=offsets[1:])
+    packed = np.memmap(mmap_path, dtype=np.uint64, mode='w+', shape=(max(int(offsets[-1]), 1),))
+    for i, signature in enumerate(signatures):
+        packed[offsets[i]:offsets[i + 1]] = signature
+    packed.flush()
+    return mmap_path, offsets
+
 
+def cache_path(content_hash):
+    return os.path.join('data', 'preprocessed', content_hash + '.npz')
 
-def preprocess_file(file_path):
+
+def load_cached_file(file_path, content_hash):
+    """Rematerialize preprocessed text and signature from the content-hash cache."""
+    cached = np.load(cache_path(content_hash))
+    cleaned_code = str(cached['code'])
+    base_name = os.path.basename(file_path)
+    out_path = os.path.join('data', 'preprocessed', base_name)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write(cleaned_code)
+    np.save(out_path + '.npy', cached['signature'])
+    return (file_path, out_path)
+
+
+def preprocess_file(file_path, content_hash=None):
     try:
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
             code = f.read()
@@ -43,19 +81,39 @@ def preprocess_file(file_path):
             cleaned_code = normalize_code(code)
         base_name = os.path.basename(file_path)
         out_path = os.path.join('data', 'preprocessed', base_name)
-        with open(out_path, 'w', encoding='utf-8') as f:
-            f.write(cleaned_code)
+        with open(out_path, 'wb', buffering=1 << 20) as f:
+            f.write(cleaned_code.encode('utf-8'))
+        signature = build_signature(cleaned_code)
+        np.save(out_path + '.npy', signature)
+        if content_hash:
+            np.savez(cache_path(content_hash), code=cleaned_code, signature=signature)
         return (file_path, out_path)
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
         return (file_path, None)
-    
-def run_parallel_preprocessing():
-    input_dir = os.path.join('data', 'uploads')
-    files = [os.path.join(input_dir, f) for f in os.listdir(input_dir) if f.endswith(('.py', '.cpp', '.java', '.h'))]
+
+def run_parallel_preprocessing(file_hashes=None, pool=None, files=None):
+    if files is None:
+        input_dir = os.path.join('data', 'uploads')
+        with os.scandir(input_dir) as entries:
+            files = [e.path for e in entries
+                     if e.is_file() and os.path.splitext(e.name)[1].lower() in VALID_EXTENSIONS]
 
     os.makedirs(os.path.join('data', 'preprocessed'), exist_ok=True)
 
-    with Pool() as pool:
-        results = pool.map(preprocess_file, files)
+    if file_hashes is None:
+        file_hashes = {}
+    cached = [(f, file_hashes[f]) for f in files
+              if f in file_hashes and os.path.exists(cache_path(file_hashes[f]))]
+    pending = [(f, file_hashes.get(f)) for f in files
+               if (f, file_hashes.get(f)) not in cached]
+
+    results = [load_cached_file(f, h) for f, h in cached]
+    if pending:
+        chunk = max(1, len(pending) // (4 * os.cpu_count()))
+        if pool is not None:
+            results.extend(pool.starmap(preprocess_file, pending, chunksize=chunk))
+        else:
+            with Pool(processes=os.cpu_count()) as own_pool:
+                results.extend(own_pool.starmap(preprocess_file, pending, chunksize=chunk))
     return results